@@ -1,38 +1,120 @@
+import json
 import logging
+import os
+import shutil
+import sqlite3
 import subprocess
 import sys
-import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from multiprocessing import Pool
 from pathlib import Path
 from typing import Iterator, Optional, Sequence, Tuple
 
+try:
+    import av
+except ImportError:  # PyAVが無い場合はffprobeのみを使用
+    av = None
+
 # ロギングの設定
 logging.basicConfig(format="%(message)s", level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 対応する動画ファイルの拡張子
-VIDEO_EXTENSIONS = {
-    ".mp4",
-    ".avi",
-    ".mkv",
-    ".mov",
-    ".wmv",
-    ".flv",
-    ".webm",
-    ".m4v",
-    ".ts",
-}
+# 対応する動画ファイルの拡張子（ドットなし）
+VIDEO_EXTENSIONS = frozenset(
+    {
+        "mp4",
+        "avi",
+        "mkv",
+        "mov",
+        "wmv",
+        "flv",
+        "webm",
+        "m4v",
+        "ts",
+    }
+)
 
 # 変換不要なコーデック
 SUPPORTED_VIDEO_CODECS = {"h264", "hevc", "av1"}
 SUPPORTED_AUDIO_CODECS = {"aac", "mp3"}
 
+# HandBrakeのエンコードオプション（入出力以外は固定）
+# --optimizeでfaststart、--no-metadata-passthruでメタデータ除去を行う
+HANDBRAKE_OPTIONS = (
+    "--format",
+    "av_mp4",
+    "--optimize",
+    "--no-metadata-passthru",
+    "--align-av",
+    "--markers",
+    "--encoder",
+    "nvenc_av1_10bit",
+    "--encoder-preset",
+    "slowest",
+    "--quality",
+    "40",
+    "--aencoder",
+    "aac",
+    "--ab",
+    "128",
+    "--mixdown",
+    "stereo",
+)
+
+# FFmpegの入力オプション（スレッド数自動・タイムスタンプ補完）
+FFMPEG_INPUT_OPTIONS = (
+    "-threads",
+    "0",
+    "-fflags",
+    "+genpts",
+)
+
+# FFmpegの出力オプション（メタデータ除去・faststart）
+FFMPEG_OUTPUT_OPTIONS = (
+    "-map_metadata",
+    "-1",
+    "-c",
+    "copy",
+    "-max_muxing_queue_size",
+    "9999",
+    "-movflags",
+    "+faststart",
+    "-f",
+    "mp4",
+)
+
+# コーデック情報のキャッシュ（再実行時にffprobeを省略する）
+CODEC_CACHE_PATH = Path.home() / ".cache" / "videotools" / "codec_cache.sqlite3"
+
+# 外部コマンドの実行ファイルパス（起動ごとのPATH検索を省略する）
+FFPROBE = shutil.which("ffprobe") or "ffprobe"
+FFMPEG = shutil.which("ffmpeg") or "ffmpeg"
+HANDBRAKE = shutil.which("HandBrakeCLI") or "HandBrakeCLI"
+
+# コーデック名の取得に十分なffprobeの解析範囲（1秒・512KB）
+PROBE_LIMIT_OPTIONS = ("-analyzeduration", "1000000", "-probesize", "524288")
+
+# エンコードの同時実行数（GPUのハードウェアエンコーダー数に合わせる）
+ENCODE_PROCESSES = max(1, int(os.getenv("ENCODE_PROCESSES", "2")))
+
+# 先読みするコンテナヘッダーのサイズ
+HEADER_PREFETCH_SIZE = 1 << 20
+
+# キャッシュDBの接続をスレッド間で共有するためのロック
+codec_cache_lock = threading.Lock()
+
 
 def get_output_path(input_path: Path) -> Path:
     """出力ファイルのパスを取得"""
     return input_path.with_suffix(".mp4")
 
 
+def get_part_path(output_path: Path) -> Path:
+    """変換中に書き込む一時出力ファイルのパスを取得（出力と同じフォルダ）"""
+    return output_path.with_name(f"{output_path.name}.part")
+
+
 def needs_encode(video_codec: str, audio_codec: str) -> bool:
     """再エンコードが必要かどうかを判定"""
     return (
@@ -41,123 +123,234 @@ def needs_encode(video_codec: str, audio_codec: str) -> bool:
     )
 
 
+def has_video_extension(name: str) -> bool:
+    """ファイル名が対応する動画の拡張子を持つかどうかを判定"""
+    dot = name.rfind(".")
+    return dot > 0 and name[dot + 1 :].lower() in VIDEO_EXTENSIONS
+
+
 def find_video_files(path: Path) -> Iterator[Path]:
     """動画ファイルを再帰的に検索"""
-    if path.is_file() and path.suffix.lower() in VIDEO_EXTENSIONS:
+    if path.is_file() and has_video_extension(path.name):
         yield path
     elif path.is_dir():
-        yield from (
-            item
-            for item in path.rglob("*")
-            if item.is_file() and item.suffix.lower() in VIDEO_EXTENSIONS
-        )
+        # os.scandirのエントリ情報を使い、ファイルごとのstatを省略する
+        directories = [str(path)]
+        while directories:
+            try:
+                with os.scandir(directories.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                        elif has_video_extension(entry.name) and entry.is_file():
+                            yield Path(entry.path)
+            except OSError:
+                # 読めないフォルダや走査中に削除されたフォルダはスキップ
+                continue
+
+
+def advise_file(path: Path, length: int, advice_name: str) -> None:
+    """ファイルのページキャッシュ利用方法をカーネルに通知（POSIXのみ）"""
+    advice = getattr(os, advice_name, None)
+    if not hasattr(os, "posix_fadvise") or advice is None:
+        return
+
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, length, advice)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
 
+def prefetch_header(path: Path) -> None:
+    """子プロセス起動中にコンテナヘッダーを先読みさせる"""
+    advise_file(path, HEADER_PREFETCH_SIZE, "POSIX_FADV_WILLNEED")
+
+
+def drop_file_cache(path: Path) -> None:
+    """書き込み済みファイルをページキャッシュから追い出す"""
+    advise_file(path, 0, "POSIX_FADV_DONTNEED")
+
+
+def get_codec_info_with_av(path: Path) -> Optional[Tuple[str, str]]:
+    """PyAVでコーデック情報を取得（プロセスを起動しない）"""
+    if av is None:
+        return None
 
-def get_codec_info(path: Path, stream_type: str) -> str:
-    """コーデック情報を取得"""
+    try:
+        with av.open(str(path), metadata_errors="ignore") as container:
+            video = container.streams.video
+            audio = container.streams.audio
+            return (
+                video[0].codec_context.codec.canonical_name if video else "unknown",
+                audio[0].codec_context.codec.canonical_name if audio else "unknown",
+            )
+    except Exception:
+        return None
+
+
+def get_codec_info_with_ffprobe(
+    path: Path, probe_options: Sequence[str] = ()
+) -> Tuple[str, str]:
+    """ffprobeでコーデック情報を取得（ビデオ・オーディオを1回で取得）"""
     try:
         result = subprocess.run(
             [
-                "ffprobe",
+                FFPROBE,
                 "-v",
                 "error",
-                "-select_streams",
-                stream_type,
+                *probe_options,
                 "-show_entries",
-                "stream=codec_name",
+                "stream=codec_type,codec_name",
                 "-of",
-                "default=noprint_wrappers=1:nokey=1",
+                "json",
                 str(path),
             ],
             capture_output=True,
             text=True,
             check=True,
         )
-        return result.stdout.strip() or "unknown"
-    except subprocess.SubprocessError:
-        return "unknown"
+        streams = json.loads(result.stdout).get("streams", [])
+    except (subprocess.SubprocessError, ValueError):
+        return "unknown", "unknown"
+
+    # 各種別の最初のストリームのコーデックを採用
+    codecs = {}
+    for stream in streams:
+        codecs.setdefault(stream.get("codec_type"), stream.get("codec_name"))
 
+    return codecs.get("video") or "unknown", codecs.get("audio") or "unknown"
 
-def get_video_info(path: Path) -> Optional[Tuple[Path, str, str]]:
+
+def get_codec_info(path: Path) -> Tuple[str, str]:
+    """コーデック情報を取得（PyAVで読めない場合はffprobeを使用）"""
+    prefetch_header(path)
+    if codecs := get_codec_info_with_av(path):
+        return codecs
+
+    # まずは解析範囲を絞って取得し、映像のコーデックが取得できなければ既定の範囲で再試行
+    # (音声が無い動画で毎回再試行しないよう、音声側は判定に使わない)
+    codecs = get_codec_info_with_ffprobe(path, PROBE_LIMIT_OPTIONS)
+    if codecs[0] == "unknown":
+        codecs = get_codec_info_with_ffprobe(path)
+    return codecs
+
+
+def open_codec_cache() -> Optional[sqlite3.Connection]:
+    """コーデック情報のキャッシュDBを開く（開けない場合はキャッシュを使わない）"""
+    try:
+        CODEC_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        # 1回だけ開いて全スレッドで共有する（アクセスはcodec_cache_lockで直列化）
+        conn = sqlite3.connect(CODEC_CACHE_PATH, timeout=30, check_same_thread=False)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS codecs ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+            "vcodec TEXT, acodec TEXT)"
+        )
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"キャッシュを開けません: {str(e)}")
+        return None
+    return conn
+
+
+def get_cached_codec_info(
+    cache: Optional[sqlite3.Connection], path: Path
+) -> Optional[Tuple[str, str]]:
+    """キャッシュからコーデック情報を取得（更新日時・サイズが一致する場合のみ）"""
+    if cache is None:
+        return None
+
+    try:
+        stat = path.stat()
+        with codec_cache_lock:
+            row = cache.execute(
+                "SELECT vcodec, acodec FROM codecs "
+                "WHERE path = ? AND mtime_ns = ? AND size = ?",
+                (str(path.resolve()), stat.st_mtime_ns, stat.st_size),
+            ).fetchone()
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"キャッシュの読み込みに失敗: {str(e)}")
+        return None
+
+    return (row[0], row[1]) if row else None
+
+
+def store_codec_info(
+    cache: Optional[sqlite3.Connection], path: Path, vcodec: str, acodec: str
+) -> None:
+    """コーデック情報をキャッシュに保存"""
+    if cache is None:
+        return
+
+    try:
+        stat = path.stat()
+        with codec_cache_lock, cache:
+            cache.execute(
+                "INSERT OR REPLACE INTO codecs VALUES (?, ?, ?, ?, ?)",
+                (str(path.resolve()), stat.st_mtime_ns, stat.st_size, vcodec, acodec),
+            )
+    except (OSError, sqlite3.Error) as e:
+        logger.error(f"キャッシュの書き込みに失敗: {str(e)}")
+
+
+def get_video_info(
+    path: Path, cache: Optional[sqlite3.Connection] = None
+) -> Optional[Tuple[Path, str, str]]:
     """ビデオファイルの情報を取得"""
     if not path.is_file():
         logger.error(f"エラー: ファイルが見つかりません: {path}")
         return None
 
-    vcodec = get_codec_info(path, "v:0")
+    if cached := get_cached_codec_info(cache, path):
+        return path, *cached
+
+    vcodec, acodec = get_codec_info(path)
     if vcodec == "unknown":
         logger.error(f"エラー: コーデック情報を取得できません: {path}")
         return None
 
-    return path, vcodec, get_codec_info(path, "a:0")
+    store_codec_info(cache, path, vcodec, acodec)
+    return path, vcodec, acodec
 
 
-def get_handbrake_command(path: Path, tmp_path: Path) -> Sequence[str]:
+def get_handbrake_command(src: str, dst: str) -> Sequence[str]:
     """HandBrakeコマンドを生成（エンコード用）"""
     return [
-        "HandBrakeCLI",
+        HANDBRAKE,
         "--force",
         "--input",
-        str(path),
+        src,
         "--output",
-        str(tmp_path),
-        "--format",
-        "av_mp4",
-        "--optimize",
-        "--align-av",
-        "--markers",
-        "--encoder",
-        "nvenc_av1_10bit",
-        "--encoder-preset",
-        "slowest",
-        "--quality",
-        "40",
-        "--aencoder",
-        "aac",
-        "--ab",
-        "128",
-        "--mixdown",
-        "stereo",
+        dst,
+        *HANDBRAKE_OPTIONS,
     ]
 
 
-def get_ffmpeg_copy_command(path: Path, tmp_path: Path) -> Sequence[str]:
-    """FFmpegコマンドを生成（コピー用）"""
+def get_ffmpeg_copy_command(src: str, dst: str) -> Sequence[str]:
+    """FFmpegコマンドを生成（コピー・メタデータ除去を1パスで実行）"""
     return [
-        "ffmpeg",
+        FFMPEG,
         "-hide_banner",
         "-y",
+        *FFMPEG_INPUT_OPTIONS,
         "-i",
-        str(path),
-        "-c",
-        "copy",
-        str(tmp_path),
-    ]
-
-
-def get_ffmpeg_command(tmp_path: Path, output_path: Path) -> Sequence[str]:
-    """FFmpegコマンドを生成（メタデータ除去用）"""
-    return [
-        "ffmpeg",
-        "-hide_banner",
-        "-i",
-        str(tmp_path),
-        "-map_metadata",
-        "-1",
-        "-c",
-        "copy",
-        "-movflags",
-        "+faststart",
-        str(output_path),
+        src,
+        *FFMPEG_OUTPUT_OPTIONS,
+        dst,
     ]
 
 
 def run_command(cmd: Sequence[str], description: str, path: Path) -> bool:
     """コマンドを実行"""
     try:
+        # 失敗時に表示するのは標準エラーのみなので、標準出力は捨てる
         result = subprocess.run(
             cmd,
-            capture_output=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
             text=True,
             encoding="utf-8",
             errors="replace",
@@ -173,6 +366,46 @@ def run_command(cmd: Sequence[str], description: str, path: Path) -> bool:
         return False
 
 
+def remove_file(path: Path) -> None:
+    """ファイルが存在すれば削除"""
+    try:
+        if path.exists():
+            path.unlink()
+    except Exception as e:
+        logger.error(f"ファイルの削除に失敗: {str(e)}")
+
+
+def remux_video(path: Path, output_path: Path) -> bool:
+    """ビデオをmp4コンテナに変換（再エンコードなし）"""
+    cmd = get_ffmpeg_copy_command(os.fspath(path), os.fspath(output_path))
+    if not run_command(cmd, "コピー", path):
+        # 途中まで書き込まれた出力を残さない
+        remove_file(output_path)
+        return False
+
+    drop_file_cache(output_path)
+    return True
+
+
+def encode_video(path: Path, output_path: Path) -> bool:
+    """ビデオを再エンコード（faststart・メタデータ除去もHandBrakeで行う）"""
+    cmd = get_handbrake_command(os.fspath(path), os.fspath(output_path))
+    if not run_command(cmd, "エンコード", path):
+        # 途中まで書き込まれた出力を残さない
+        remove_file(output_path)
+        return False
+
+    # エンコード後のファイルサイズを確認
+    if not output_path.exists() or output_path.stat().st_size == 0:
+        logger.error(
+            f"エラー: エンコード後のファイルが存在しないか空です: {output_path}"
+        )
+        remove_file(output_path)
+        return False
+
+    return True
+
+
 def convert_video(path: Path, video_codec: str, audio_codec: str) -> bool:
     """ビデオを変換"""
     output_path = get_output_path(path)
@@ -180,60 +413,33 @@ def convert_video(path: Path, video_codec: str, audio_codec: str) -> bool:
         logger.info(f"スキップ: 出力ファイルが存在します: {output_path}")
         return True
 
+    encode = needs_encode(video_codec, audio_codec)
     logger.info(f"コーデック - ビデオ: {video_codec}, オーディオ: {audio_codec}")
-    logger.info(
-        f"{'エンコード' if needs_encode(video_codec, audio_codec) else 'コンテナ変換'}中: {path}"
-    )
-
-    # 一時ファイルを作成
-    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp_file:
-        tmp_path = Path(tmp_file.name)
-
-    try:
-        # 変換処理
-        cmd = (
-            get_handbrake_command(path, tmp_path)
-            if needs_encode(video_codec, audio_codec)
-            else get_ffmpeg_copy_command(path, tmp_path)
-        )
-        description = (
-            "エンコード" if needs_encode(video_codec, audio_codec) else "コピー"
-        )
-
-        if not run_command(cmd, description, path):
-            return False
-
-        # エンコード後のファイルサイズを確認
-        if not tmp_path.exists() or tmp_path.stat().st_size == 0:
-            logger.error(
-                f"エラー: エンコード後のファイルが存在しないか空です: {tmp_path}"
-            )
-            return False
+    logger.info(f"{'エンコード' if encode else 'コンテナ変換'}中: {path}")
 
-        # メタデータ除去
-        if not run_command(
-            get_ffmpeg_command(tmp_path, output_path), "メタデータ除去", path
-        ):
-            return False
+    # 変換処理（完了するまで出力ファイル名では書き込まない）
+    part_path = get_part_path(output_path)
+    prefetch_header(path)
+    if encode:
+        success = encode_video(path, part_path)
+    else:
+        success = remux_video(path, part_path)
 
-        logger.info(f"変換成功: {path}")
-        return True
+    if not success:
+        return False
 
-    finally:
-        try:
-            if tmp_path.exists():
-                tmp_path.unlink()
-        except Exception as e:
-            logger.error(f"一時ファイルの削除に失敗: {str(e)}")
+    # 同じフォルダ内でのリネームなので、完成した出力だけがアトミックに現れる
+    os.replace(part_path, output_path)
+    logger.info(f"変換成功: {path}")
+    return True
 
 
-def process_single_file(args: Tuple[int, Path, int]) -> None:
+def process_single_file(args: Tuple[int, Tuple[Path, str, str], int]) -> None:
     """単一のビデオファイルを処理"""
     try:
-        index, video_file, total_files = args
+        index, video_info, total_files = args
         logger.info(f"\n[{index + 1}/{total_files}] 処理中...")
-        if video_info := get_video_info(video_file):
-            convert_video(*video_info)
+        convert_video(*video_info)
     except Exception as e:
         logger.error(f"ファイル処理中にエラーが発生: {str(e)}")
 
@@ -251,15 +457,66 @@ def process_paths(paths: Sequence[str]) -> None:
             logger.info("変換対象のファイルが見つかりません")
             return
 
-        total_files = len(video_files)
+        # 出力済みのファイルはコーデック情報を取得せずにスキップ
+        pending_files = []
+        for video_file in video_files:
+            output_path = get_output_path(video_file)
+            if output_path.exists():
+                logger.info(f"スキップ: 出力ファイルが存在します: {output_path}")
+            else:
+                pending_files.append(video_file)
+
+        # ffprobeはI/O待ちが主なのでスレッドで並列に実行
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+        cache = open_codec_cache()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(get_video_info, video_file, cache): video_file
+                    for video_file in pending_files
+                }
+                video_infos = []
+                for future in as_completed(futures):
+                    # 1ファイルの失敗で他のファイルの変換を止めない
+                    try:
+                        video_info = future.result()
+                    except Exception as e:
+                        logger.error(f"エラー: 情報の取得に失敗: {futures[future]}")
+                        logger.error(f"エラー内容: {str(e)}")
+                        continue
+                    if video_info:
+                        video_infos.append(video_info)
+        finally:
+            if cache is not None:
+                cache.close()
+
+        if not video_infos:
+            logger.info("変換対象のファイルが見つかりません")
+            return
+
+        total_files = len(video_infos)
         logger.info(f"合計 {total_files} 個のファイルを処理します")
 
-        # 処理対象のファイルリストを準備
-        process_args = [(i, f, total_files) for i, f in enumerate(video_files)]
+        # 大きいファイルから処理して、最後に長い処理が残らないようにする
+        video_infos.sort(key=lambda info: info[0].stat().st_size, reverse=True)
 
-        # 4プロセスで並列処理
-        with Pool(processes=4) as pool:
-            pool.map(process_single_file, process_args)
+        # 処理対象のファイルリストを準備
+        process_args = [(i, info, total_files) for i, info in enumerate(video_infos)]
+        encode_args = [args for args in process_args if needs_encode(*args[1][1:])]
+        copy_args = [args for args in process_args if not needs_encode(*args[1][1:])]
+
+        # エンコードはGPUのエンコーダー数に合わせたプロセスで、
+        # コンテナ変換はI/O待ちが主なのでスレッドで並列処理
+        with Pool(processes=ENCODE_PROCESSES) as pool, ThreadPoolExecutor(
+            max_workers=os.cpu_count()
+        ) as executor:
+            # 空いたワーカーから順に1件ずつ割り当てる
+            encode_results = pool.imap_unordered(
+                process_single_file, encode_args, chunksize=1
+            )
+            list(executor.map(process_single_file, copy_args))
+            for _ in encode_results:
+                pass
 
     except Exception as e:
         logger.error(f"エラーが発生しました: {str(e)}")
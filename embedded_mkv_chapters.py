@@ -3,8 +3,10 @@
 
 from __future__ import annotations
 
+import codecs
 import datetime
 import pathlib
+import re
 import shutil
 import subprocess
 import sys
@@ -13,13 +15,16 @@ import traceback
 
 # --- 定数定義 ---
 SCRIPT_NAME = "set_mkv_chapters.py"
-MIN_BOOKMARK_PARTS = 2
 MIN_ARG_COUNT = 2
 # 試行するエンコーディングのリスト
 ENCODINGS_TO_TRY = ["utf-8-sig", "cp932", "utf-16"]
 # ブックマークのタイムスタンプを一律で調整するオフセット値 (ミリ秒単位)
 # 例: -500 -> 0.5秒早める, 500 -> 0.5秒遅らせる
 TIMESTAMP_OFFSET_MS = -500
+# ブックマーク行 (例: 1=12345*名前*サムネイル) からミリ秒と名前を抽出するパターン
+BOOKMARK_PATTERN = re.compile(
+    r"^[^=\r\n]*=[ \t]*([+-]?\d+)[ \t]*\*([^*\r\n]*)", re.MULTILINE
+)
 
 
 def find_cli_tool(tool_name: str) -> str | None:
@@ -42,16 +47,27 @@ def find_cli_tool(tool_name: str) -> str | None:
     return path
 
 
-def read_pbf_file(pbf_path: pathlib.Path) -> list[str] | None:
-    """複数のエンコーディングを試してpbfファイルを読み込む。"""
-    for encoding in ENCODINGS_TO_TRY:
+def read_pbf_file(pbf_path: pathlib.Path) -> str | None:
+    """pbfファイルを一度だけ読み込み、エンコーディングを判定してデコードする。"""
+    try:
+        data = pbf_path.read_bytes()
+    except OSError:
+        print(f"エラー: ファイルの読み込みに失敗しました: {pbf_path}")
+        return None
+
+    # UTF-16のBOMがあれば判定を省略する (UTF-8のBOMはutf-8-sigで処理される)
+    encodings = ENCODINGS_TO_TRY
+    if data.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encodings = ["utf-16"]
+
+    for encoding in encodings:
         try:
-            return pbf_path.read_text(encoding=encoding).splitlines()
-        except (UnicodeDecodeError, OSError):  # noqa: PERF203
+            return data.decode(encoding)
+        except UnicodeDecodeError:  # noqa: PERF203
             continue  # 次のエンコーディングを試す
 
-    print(f"エラー: ファイルの読み込みに失敗しました: {pbf_path}")
-    print(f"試行したエンコーディング: {', '.join(ENCODINGS_TO_TRY)}")
+    print(f"エラー: ファイルのデコードに失敗しました: {pbf_path}")
+    print(f"試行したエンコーディング: {', '.join(encodings)}")
     return None
 
 
@@ -69,24 +85,18 @@ def convert_pbf_to_chapters(pbf_path: pathlib.Path) -> pathlib.Path | None:
     bookmarks: list[tuple[datetime.timedelta, str]] = []
 
     print(f"情報: '{pbf_path.name}' を解析しています...")
-    lines = read_pbf_file(pbf_path)
-    if lines is None:
+    text = read_pbf_file(pbf_path)
+    if text is None:
         return None
 
-    for line in lines:
-        if "=" in line and "*" in line:
-            line_content = line.strip().split("=", 1)[1]
-            parts = line_content.split("*", 2)
-            if len(parts) >= MIN_BOOKMARK_PARTS:
-                try:
-                    milliseconds = int(parts[0])
-                    # オフセットを適用し、タイムスタンプが0未満にならないようにする
-                    adjusted_ms = max(0, milliseconds + TIMESTAMP_OFFSET_MS)
-                    name = parts[1].strip()
-                    td = datetime.timedelta(milliseconds=adjusted_ms)
-                    bookmarks.append((td, name))
-                except (ValueError, IndexError):
-                    continue
+    # 行ごとのリストを作らず、正規表現で1行ずつブックマークを取り出す
+    for match in BOOKMARK_PATTERN.finditer(text):
+        milliseconds = int(match.group(1))
+        # オフセットを適用し、タイムスタンプが0未満にならないようにする
+        adjusted_ms = max(0, milliseconds + TIMESTAMP_OFFSET_MS)
+        name = match.group(2).strip()
+        td = datetime.timedelta(milliseconds=adjusted_ms)
+        bookmarks.append((td, name))
 
     if not bookmarks:
         print(f"情報: {pbf_path.name} に変換可能なブックマークがありません。")
@@ -99,17 +109,21 @@ def convert_pbf_to_chapters(pbf_path: pathlib.Path) -> pathlib.Path | None:
         bookmarks.insert(0, (datetime.timedelta(seconds=0), "ブックマーク 1"))
     # --- ▲▲▲ 変更箇所 ▲▲▲ ---
 
-    with output_path.open("w", encoding="utf-8") as f:
-        for i, (td, name) in enumerate(bookmarks, 1):
-            total_seconds = td.total_seconds()
-            hours, remainder = divmod(total_seconds, 3600)
-            minutes, seconds = divmod(remainder, 60)
-            formatted_time = (
-                f"{int(hours):02}:{int(minutes):02}:"
-                f"{int(seconds):02}.{int(td.microseconds / 1000):03}"
-            )
-            f.write(f"CHAPTER{i:02}={formatted_time}\n")
-            f.write(f"CHAPTER{i:02}NAME={name}\n")
+    chapter_lines: list[str] = []
+    for i, (td, name) in enumerate(bookmarks, 1):
+        total_seconds = td.total_seconds()
+        hours, remainder = divmod(total_seconds, 3600)
+        minutes, seconds = divmod(remainder, 60)
+        formatted_time = (
+            f"{int(hours):02}:{int(minutes):02}:"
+            f"{int(seconds):02}.{int(td.microseconds / 1000):03}"
+        )
+        chapter_lines.append(
+            f"CHAPTER{i:02}={formatted_time}\nCHAPTER{i:02}NAME={name}\n"
+        )
+
+    # まとめて1回で書き込む
+    output_path.write_text("".join(chapter_lines), encoding="utf-8")
 
     print(f"情報: 一時チャプターファイルを生成しました: {output_path.name}")
     return output_path
@@ -1,27 +1,84 @@
+import functools
+import itertools
+import os
 import re
-import shutil
 import sys
 import tempfile
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Optional, Set, Tuple
 
 from pathvalidate import sanitize_filename
 
 from utils import (
     TEST_MODE,
+    find_command,
     find_files,
     format_time,
+    get_loudnorm_filter,
+    measure_loudness,
     normalize_audio,
     run_command,
 )
 
+# 従来のHandBrake + ffmpeg-normalizeで処理するかどうか（--legacyと同じ）
+USE_HANDBRAKE = os.getenv("USE_HANDBRAKE", "false").lower() in ("true", "1")
+
+# チャプターの同時エンコード数
+HB_CONCURRENCY = max(1, int(os.getenv("HB_CONCURRENCY", "2")))
+
+# 同時に処理するMKVファイル数（短いファイルが続いてもエンコーダーを遊ばせないため）
+MKV_CONCURRENCY = max(1, int(os.getenv("MKV_CONCURRENCY", "2")))
+
+# 使用するNVENCエンコーダー (h264, hevc, av1, autoは利用可能な中で最も効率の良いもの)
+VIDEO_CODEC_PREF = os.getenv("VIDEO_CODEC_PREF", "h264").lower()
+
+# NVENCエンコーダー（効率の良い順）とHandBrakeでの名前
+NVENC_ENCODERS = {
+    "av1_nvenc": "nvenc_av1",
+    "hevc_nvenc": "nvenc_h265",
+    "h264_nvenc": "nvenc_h264",
+}
+
+# NVENCのスループットを優先するエンコーダーオプション（HandBrake用）
+NVENC_THROUGHPUT_ENCOPTS = "rc-lookahead=0:spatial-aq=0:temporal-aq=0:multipass=0"
+
+# チャプターファイルの行 (例: CHAPTER01=00:00:00.000, CHAPTER01NAME=Chapter 01)
+CHAPTER_LINE_PATTERN = re.compile(r"^CHAPTER(\d+)(NAME)?=(.*)$")
+
+# デフォルトのチャプター名
+DEFAULT_CHAPTER_NAME_PATTERN = re.compile(r"^(Chapter|ブックマーク) \d+$")
+
+# エンコード対象のチャプター (出力ファイル, 番号, 名前, 開始秒, 終了秒, 進捗表示)
+ChapterJob = Tuple[Path, int, str, float, Optional[float], str]
+
+# チャプターを割り当てるGPUを順番に選ぶためのカウンター
+GPU_COUNTER = itertools.count()
+
+# 並列処理中の表示が混ざらないようにするためのロック
+print_lock = threading.Lock()
+
+# 全ファイルを通した同時エンコード数の上限（NVENCの同時セッション数を超えないため）
+encode_slots = threading.BoundedSemaphore(HB_CONCURRENCY)
+
+# 処理対象にした出力ファイル（並列処理中の別のファイルと同じ出力先に書き込まないため）
+claimed_outputs: Set[str] = set()
+claimed_outputs_lock = threading.Lock()
+
+
+def locked_print(message: str) -> None:
+    """他のスレッドと表示が混ざらないように出力"""
+    with print_lock:
+        print(message)
+
 
 def check_dependencies(commands: List[str]) -> bool:
     """必要な外部コマンドが利用可能か確認"""
     missing = []
     for cmd in commands:
-        if not shutil.which(cmd):
+        if not find_command(cmd):
             missing.append(cmd)
 
     if missing:
@@ -34,32 +91,46 @@ def check_dependencies(commands: List[str]) -> bool:
 
 def is_default_chapter_name(name: str) -> bool:
     """デフォルトのチャプター名かどうかを判定"""
-    pattern = r"^(Chapter|ブックマーク) \d+$"
-    return bool(re.match(pattern, name))
+    return bool(DEFAULT_CHAPTER_NAME_PATTERN.match(name))
 
 
-def parse_chapter_file(text: str) -> List[Tuple[int, str]]:
-    """チャプターファイルのテキストを解析"""
-    chapters = []
+def parse_timestamp(timestamp: str) -> float:
+    """00:00:00.000 形式のタイムスタンプを秒数に変換"""
+    hours, minutes, seconds = timestamp.split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def parse_chapter_file(text: str) -> List[Tuple[int, str, float, Optional[float]]]:
+    """チャプターファイルのテキストを解析（番号・名前・開始秒・終了秒）"""
+    entries = []
     current_number = None
+    current_start = 0.0
 
     for line in text.splitlines():
-        if not line:
+        match = CHAPTER_LINE_PATTERN.match(line)
+        if not match:
             continue
 
-        if line.startswith("CHAPTER") and "NAME" not in line:
-            # 例: CHAPTER01=00:00:00.000
-            current_number = int(line[7:9])
-        elif line.startswith("CHAPTER") and "NAME" in line:
+        number, is_name, value = match.groups()
+        if is_name:
             # 例: CHAPTER01NAME=Chapter 01
-            chapter_name = line.split("=", 1)[1]
-            if not is_default_chapter_name(chapter_name):
-                chapters.append((current_number, chapter_name))
+            entries.append((current_number, value, current_start))
+        else:
+            # 例: CHAPTER01=00:00:00.000
+            current_number = int(number)
+            current_start = parse_timestamp(value)
+
+    chapters = []
+    for i, (number, name, start) in enumerate(entries):
+        # 終了位置は次のチャプターの開始位置（最後のチャプターはファイル末尾まで）
+        end = entries[i + 1][2] if i + 1 < len(entries) else None
+        if not is_default_chapter_name(name):
+            chapters.append((number, name, start, end))
 
     return chapters
 
 
-def get_chapters(mkv_file: Path) -> List[Tuple[int, str]]:
+def get_chapters(mkv_file: Path) -> List[Tuple[int, str, float, Optional[float]]]:
     """mkvファイルからチャプター情報を取得"""
     result = run_command(
         cmd=["mkvextract", str(mkv_file), "chapters", "-s"],
@@ -81,6 +152,34 @@ def get_temp_path(suffix: str) -> Path:
     return Path(temp_file.name)
 
 
+def can_use_encoder(encoder: str) -> bool:
+    """エンコーダーがこの環境のGPUで使えるか、短い映像を実際にエンコードして確認"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-v", "error"]
+    cmd.extend(["-f", "lavfi", "-i", "color=size=256x256:duration=0.1"])
+    cmd.extend(["-c:v", encoder, "-f", "null", "-"])
+    result = run_command(
+        cmd=cmd,
+        description=f"{encoder}の確認",
+        capture_output=True,
+        capture_stdout=False,
+        silent=True,
+    )
+    return result is not None
+
+
+@functools.lru_cache(maxsize=None)
+def pick_encoder() -> str:
+    """使用するNVENCエンコーダーを選択 (ffmpegでの名前)"""
+    if VIDEO_CODEC_PREF != "auto":
+        encoder = f"{VIDEO_CODEC_PREF}_nvenc"
+        return encoder if encoder in NVENC_ENCODERS else "h264_nvenc"
+
+    for encoder in NVENC_ENCODERS:
+        if can_use_encoder(encoder):
+            return encoder
+    return "h264_nvenc"
+
+
 def get_handbrake_command(
     input_file: Path, temp_output: Path, chapter_number: int
 ) -> List[str]:
@@ -101,21 +200,29 @@ def get_handbrake_command(
     cmd.extend(["--align-av"])  # AV同期
 
     # ビデオオプション
-    cmd.extend(["--encoder", "nvenc_h264" if TEST_MODE else "x264"])
+    encoder = NVENC_ENCODERS[pick_encoder()] if TEST_MODE else "x264"
+    cmd.extend(["--encoder", encoder])
     cmd.extend(["--encoder-preset", "fastest" if TEST_MODE else "medium"])
     if not TEST_MODE:
         cmd.extend(["--encoder-tune", "film"])  # x264用
-    cmd.extend(["--encoder-profile", "high"])
+    # highプロファイルはH.264用
+    is_h264 = encoder in ("x264", "nvenc_h264")
+    cmd.extend(["--encoder-profile", "high" if is_h264 else "auto"])
     cmd.extend(["--encoder-level", "auto"])
     cmd.extend(["--vb", "6000"])
     if not TEST_MODE:
         cmd.extend(["--multi-pass", "--turbo"])  # x264用
+    else:
+        # NVENC用: 先読み・適応量子化を無効にしてスループットを優先
+        cmd.extend(["--encopts", NVENC_THROUGHPUT_ENCOPTS])
     cmd.extend(["--cfr"])  # ソースの平均フレームレートで固定
     # cmd.extend(["--enable-hw-decoding", "nvdec"])
 
     # オーディオオプション
     cmd.extend(["--first-audio"])  # 最初のトラックのみ選択
-    cmd.extend(["--aencoder", "flac24"])
+    # 音量正規化でAACにエンコードするため、ここでは再エンコードせずにパススルー
+    cmd.extend(["--aencoder", "copy"])
+    cmd.extend(["--audio-fallback", "flac24"])  # パススルーできない場合のみ
 
     # 画像オプション
     cmd.extend(["--width", "1920"])
@@ -145,107 +252,413 @@ def get_handbrake_command(
     return cmd
 
 
-def extract_chapter(
+def encode_with_handbrake(
     input_file: Path,
     output_file: Path,
     chapter_number: int,
-) -> bool:
-    """HandBrakeを使用して特定のチャプターを抽出してmp4に変換し、音量を正規化"""
+    chapter_name: str,
+    progress: str,
+) -> Optional[Path]:
+    """HandBrakeを使用して特定のチャプターを一時ファイルにエンコード"""
+    locked_print(f"\nエンコード中 [{progress}]: '{chapter_name}'")
+
     # 一時ファイルのパスを生成
     temp_output = get_temp_path(output_file.suffix)
 
-    # HandBrakeコマンドを生成
-    handbrake_cmd = get_handbrake_command(input_file, temp_output, chapter_number)
-
-    try:
-        # HandBrakeでエンコード
+    # HandBrakeでエンコード
+    with encode_slots:
         result = run_command(
-            cmd=handbrake_cmd,
+            cmd=get_handbrake_command(input_file, temp_output, chapter_number),
             description="エンコード",
             capture_output=True,
+            capture_stdout=False,
             path=input_file,
         )
-        if result is None:
-            if temp_output.exists():
-                temp_output.unlink()
-            return False
-
-        # 音量を正規化
-        try:
-            normalize_audio(temp_output, output_file)
-        except Exception as e:
-            print(f"エラー: 音量正規化に失敗: {output_file}")
-            print(f"エラー内容: {str(e)}")
-            if output_file.exists():
-                output_file.unlink()
-            return False
-
-        return True
+    if result is None:
+        temp_output.unlink(missing_ok=True)
+        return None
+
+    return temp_output
+
+
+def normalize_chapter(
+    temp_output: Path, output_file: Path, chapter_name: str, progress: str
+) -> bool:
+    """エンコード済みのチャプターの音量を正規化してmp4に出力"""
+    try:
+        normalize_audio(temp_output, output_file)
+    except Exception as e:
+        locked_print(f"エラー: 音量正規化に失敗: {output_file}\nエラー内容: {str(e)}")
+        if output_file.exists():
+            output_file.unlink()
+        return False
     finally:
-        try:
-            temp_output.unlink()
-        except FileNotFoundError:
-            pass  # ファイルが既に削除されている場合は無視
+        temp_output.unlink(missing_ok=True)
+
+    locked_print(f"完了 [{progress}]: '{chapter_name}'")
+    return True
+
 
+def process_chapters_with_handbrake(mkv_file: Path, jobs: List[ChapterJob]) -> bool:
+    """HandBrakeでのエンコードと音量正規化をパイプラインで処理
+
+    音量正規化は別スレッドで順に行い、その間も次のチャプターのエンコードを進める
+    """
+    # 音量正規化を待つ一時ファイルが溜まらないよう、先行してエンコードする数を制限
+    # (枠は音量正規化が終わった時点で返す)
+    pending_slots = threading.BoundedSemaphore(HB_CONCURRENCY)
+
+    with ThreadPoolExecutor(max_workers=HB_CONCURRENCY) as encoder, ThreadPoolExecutor(
+        max_workers=1
+    ) as normalizer:
+
+        def normalize_and_release(
+            temp_output: Path, output_file: Path, chapter_name: str, progress: str
+        ) -> bool:
+            try:
+                return normalize_chapter(
+                    temp_output, output_file, chapter_name, progress
+                )
+            finally:
+                pending_slots.release()
+
+        def encode_and_queue(job: ChapterJob) -> Optional[Future]:
+            # エンコードが終わったチャプターから音量正規化に回す
+            output_file, chapter_number, chapter_name, _, _, progress = job
+            try:
+                temp_output = encode_with_handbrake(
+                    mkv_file, output_file, chapter_number, chapter_name, progress
+                )
+            except Exception:
+                pending_slots.release()
+                raise
+            if temp_output is None:
+                pending_slots.release()
+                return None
+            return normalizer.submit(
+                normalize_and_release, temp_output, output_file, chapter_name, progress
+            )
+
+        # 枠の取得は投入順に行い、先に投入したチャプターが枠を待ち続けないようにする
+        encode_futures = []
+        for job in jobs:
+            pending_slots.acquire()
+            encode_futures.append(encoder.submit(encode_and_queue, job))
+
+        normalize_futures = [future.result() for future in encode_futures]
+        results = [
+            future is not None and future.result() for future in normalize_futures
+        ]
+
+    return all(results)
+
+
+def get_seek_options(start: float, end: Optional[float]) -> List[str]:
+    """チャプターの範囲を指定する入力オプションを生成"""
+    options = ["-ss", f"{start:.3f}"]
+    if end is not None:
+        options.extend(["-t", f"{end - start:.3f}"])
+    return options
+
+
+@functools.lru_cache(maxsize=None)
+def get_gpu_count() -> int:
+    """NVIDIA GPUの数を取得（取得できない場合は1）"""
+    if not find_command("nvidia-smi"):
+        return 1
+
+    result = run_command(
+        cmd=["nvidia-smi", "-L"],
+        description="GPU一覧取得",
+        capture_output=True,
+        silent=True,
+    )
+    if result is None:
+        return 1
+
+    # 例: GPU 0: NVIDIA GeForce RTX 4090 (UUID: GPU-...)
+    return max(1, sum(line.startswith("GPU ") for line in result.stdout.splitlines()))
+
+
+def get_video_options(gpu_id: int) -> List[str]:
+    """FFmpegのビデオオプションを生成（2パスエンコードの両方で共通）"""
+    cmd: List[str] = []
+
+    encoder = pick_encoder() if TEST_MODE else "libx264"
+    if TEST_MODE:
+        cmd.extend(["-c:v", encoder, "-preset", "p1", "-tune", "ll"])
+        cmd.extend(["-gpu", str(gpu_id)])
+        # 先読み・適応量子化を無効にしてスループットを優先
+        cmd.extend(["-rc-lookahead", "0", "-spatial_aq", "0", "-temporal_aq", "0"])
+    else:
+        cmd.extend(["-c:v", encoder, "-preset", "medium", "-tune", "film"])
+        cmd.extend(["-pix_fmt", "yuv420p"])
+    if encoder in ("libx264", "h264_nvenc"):
+        cmd.extend(["-profile:v", "high"])
+    elif encoder == "hevc_nvenc":
+        cmd.extend(["-tag:v", "hvc1"])  # Apple製品で再生できるように
+    cmd.extend(["-b:v", "6000k"])
+    cmd.extend(["-fps_mode", "cfr"])  # ソースの平均フレームレートで固定
+
+    # 画像オプション
+    if TEST_MODE:
+        # scale_cudaは色変換を行わないため、ソースの色空間のまま出力する
+        cmd.extend(["-vf", "scale_cuda=1920:1080:format=yuv420p"])
+    else:
+        # HandBrakeの--colorspace bt709と同様にBT.709へ変換し、変換後の色情報を付与
+        cmd.extend(["-vf", "scale=1920:1080:out_color_matrix=bt709:out_range=tv"])
+        cmd.extend(["-colorspace", "bt709", "-color_primaries", "bt709"])
+        cmd.extend(["-color_trc", "bt709", "-color_range", "tv"])
+
+    return cmd
 
-def process_mkv_file(mkv_file: Path) -> bool:
+
+def get_first_pass_command(
+    input_file: Path, seek_options: List[str], passlogfile: Path
+) -> List[str]:
+    """x264の1パス目のFFmpegコマンドを生成（映像の解析のみで出力はしない）"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-y"]
+    cmd.extend(seek_options)
+    cmd.extend(["-i", str(input_file)])
+    cmd.extend(["-map", "0:v:0"])
+    # libx264は既定で1パス目を高速な設定で行う（HandBrakeの--turboに相当）
+    cmd.extend(get_video_options(0))
+    cmd.extend(["-pass", "1", "-passlogfile", str(passlogfile)])
+    cmd.extend(["-an", "-f", "null", "-"])
+    return cmd
+
+
+def get_ffmpeg_command(
+    input_file: Path,
+    output_file: Path,
+    seek_options: List[str],
+    audio_filter: str,
+    gpu_id: int = 0,
+    passlogfile: Optional[Path] = None,
+) -> List[str]:
+    """FFmpegコマンドを生成（切り出し・エンコード・音量正規化を1回で実行）"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-y"]
+
+    # ソースオプション
+    if TEST_MODE:
+        # デコードからエンコードまで指定したGPUのメモリ上で処理
+        cmd.extend(["-hwaccel", "cuda", "-hwaccel_output_format", "cuda"])
+        cmd.extend(["-hwaccel_device", str(gpu_id)])
+    cmd.extend(seek_options)
+    cmd.extend(["-i", str(input_file)])
+    cmd.extend(["-map", "0:v:0", "-map", "0:a:0"])  # 最初のトラックのみ選択
+
+    # ビデオオプション（1パス目の解析結果があれば2パス目として使用）
+    cmd.extend(get_video_options(gpu_id))
+    if passlogfile is not None:
+        cmd.extend(["-pass", "2", "-passlogfile", str(passlogfile)])
+
+    # オーディオオプション（測定済みの値で音量を正規化）
+    cmd.extend(["-af", audio_filter, "-ar", "48000"])
+    cmd.extend(["-c:a", "aac", "-b:a", "128k"])
+
+    # 出力先オプション
+    cmd.extend(["-sn", "-dn"])  # 字幕・データトラック無し
+    cmd.extend(["-map_metadata", "-1", "-map_chapters", "-1"])  # チャプターマーカー無し
+    cmd.extend(["-movflags", "+faststart"])  # MOOVアトムを先頭に配置
+    cmd.append(str(output_file))
+
+    return cmd
+
+
+def run_encode(
+    input_file: Path,
+    output_file: Path,
+    seek_options: List[str],
+    audio_filter: str,
+    gpu_id: int,
+) -> bool:
+    """エンコードを実行（x264はHandBrakeの--multi-passと同様に2パスで実行）"""
+    # 1パス目の解析結果はチャプターごとに別の一時フォルダに置く
+    with tempfile.TemporaryDirectory() as temp_dir:
+        passlogfile = None if TEST_MODE else Path(temp_dir) / "x264"
+        commands = [
+            get_ffmpeg_command(
+                input_file, output_file, seek_options, audio_filter, gpu_id, passlogfile
+            )
+        ]
+        if passlogfile is not None:
+            commands.insert(
+                0, get_first_pass_command(input_file, seek_options, passlogfile)
+            )
+
+        for cmd in commands:
+            result = run_command(
+                cmd=cmd,
+                description="エンコード",
+                capture_output=True,
+                capture_stdout=False,
+                path=input_file,
+            )
+            if result is None:
+                return False
+
+    return True
+
+
+def encode_and_normalize(
+    input_file: Path, output_file: Path, start: float, end: Optional[float]
+) -> bool:
+    """FFmpegでチャプターを切り出してmp4にエンコードし、同時に音量を正規化"""
+    seek_options = get_seek_options(start, end)
+
+    # チャプター範囲の音声のラウドネスを測定
+    measured = measure_loudness(input_file, seek_options)
+    if measured is None:
+        return False
+
+    # エンコードと音量補正を同時に実行（複数GPUには順番に割り当てる）
+    gpu_id = next(GPU_COUNTER) % get_gpu_count() if TEST_MODE else 0
+    with encode_slots:
+        encoded = run_encode(
+            input_file, output_file, seek_options, get_loudnorm_filter(measured), gpu_id
+        )
+    if not encoded:
+        if output_file.exists():
+            output_file.unlink()
+        return False
+
+    return True
+
+
+def encode_chapter(
+    mkv_file: Path,
+    output_file: Path,
+    chapter_name: str,
+    start: float,
+    end: Optional[float],
+    progress: str,
+) -> bool:
+    """1つのチャプターをエンコード（ワーカースレッドで実行）"""
+    chapter_start_time = time.time()
+
+    locked_print(f"\nエンコード中 [{progress}]: '{chapter_name}'")
+    success = encode_and_normalize(mkv_file, output_file, start, end)
+
+    # チャプターの処理時間を表示
+    chapter_elapsed_time = time.time() - chapter_start_time
+    locked_print(
+        f"チャプター処理時間 [{progress}]: {format_time(chapter_elapsed_time)}"
+    )
+
+    return success
+
+
+def process_chapters(mkv_file: Path, jobs: List[ChapterJob]) -> bool:
+    """FFmpegでチャプターを並列にエンコード（処理はサブプロセスなのでスレッドで十分）"""
+    with ThreadPoolExecutor(max_workers=HB_CONCURRENCY) as executor:
+        futures = [
+            executor.submit(
+                encode_chapter,
+                mkv_file,
+                output_file,
+                chapter_name,
+                start,
+                end,
+                progress,
+            )
+            for output_file, _, chapter_name, start, end, progress in jobs
+        ]
+        results = [future.result() for future in futures]
+
+    return all(results)
+
+
+def process_mkv_file(mkv_file: Path, legacy: bool = False) -> bool:
     """MKVファイルを処理"""
-    print(f"\n処理開始: {mkv_file.name}")
+    locked_print(f"\n処理開始: {mkv_file.name}")
     start_time = time.time()
 
     chapters = get_chapters(mkv_file)
     if not chapters:
-        print("チャプター情報が見つかりませんでした")
+        locked_print(f"チャプター情報が見つかりませんでした: {mkv_file.name}")
         return False
 
-    success = True
+    # エンコード対象のチャプターを集める
+    # (出力済みかどうかはフォルダを1回だけ列挙して判定し、チャプターごとのstatを省略)
+    existing_names = {os.path.normcase(name) for name in os.listdir(mkv_file.parent)}
+    jobs: List[ChapterJob] = []
     total = len(chapters)
-    for i, (chapter_number, chapter_name) in enumerate(chapters, 1):
-        chapter_start_time = time.time()
-
+    for i, (chapter_number, chapter_name, start, end) in enumerate(chapters, 1):
         safe_name = sanitize_filename(chapter_name)
         output_file = mkv_file.parent / f"{safe_name}.mp4"
 
-        if output_file.exists():
-            print(f"\nスキップ [{i}/{total}]: '{chapter_name}' は既に存在します")
+        # 同名のチャプターを並列に書き込まないよう、他のファイルの分も含めて
+        # 2つ目以降はスキップする
+        output_key = os.path.normcase(str(output_file))
+        with claimed_outputs_lock:
+            is_claimed = output_key in claimed_outputs
+            claimed_outputs.add(output_key)
+        if is_claimed or os.path.normcase(output_file.name) in existing_names:
+            locked_print(f"\nスキップ [{i}/{total}]: '{chapter_name}' は既に存在します")
             continue
 
-        print(f"\nエンコード中 [{i}/{total}]: '{chapter_name}'")
-        if not extract_chapter(mkv_file, output_file, chapter_number):
-            success = False
+        jobs.append(
+            (output_file, chapter_number, chapter_name, start, end, f"{i}/{total}")
+        )
 
-        # チャプターの処理時間を表示
-        chapter_elapsed_time = time.time() - chapter_start_time
-        print(f"チャプター処理時間: {format_time(chapter_elapsed_time)}")
+    # チャプターを並列にエンコード
+    if legacy:
+        success = process_chapters_with_handbrake(mkv_file, jobs)
+    else:
+        success = process_chapters(mkv_file, jobs)
 
     # 全体の処理時間を表示
     total_elapsed_time = time.time() - start_time
-    print(f"\n全体処理時間: {format_time(total_elapsed_time)}")
+    locked_print(
+        f"\n全体処理時間 ({mkv_file.name}): {format_time(total_elapsed_time)}"
+    )
 
     return success
 
 
+def try_process_mkv_file(mkv_file: Path, legacy: bool) -> bool:
+    """MKVファイルを処理（例外が起きても他のファイルの処理を続ける）"""
+    try:
+        return process_mkv_file(mkv_file, legacy)
+    except Exception as e:
+        locked_print(
+            f"エラー: {mkv_file.name} の処理中に問題が発生しました\n詳細: {e}"
+        )
+        return False
+
+
 def main() -> None:
-    if len(sys.argv) < 2:
+    # --legacy指定時は従来のHandBrake + ffmpeg-normalizeで処理
+    legacy = USE_HANDBRAKE or "--legacy" in sys.argv[1:]
+    path_args = [arg for arg in sys.argv[1:] if arg != "--legacy"]
+
+    if not path_args:
         print("MKVファイルまたはフォルダをドラッグ&ドロップしてください")
         input("Enterキーで終了")
         return
 
-    required_commands = ["HandBrakeCLI", "mkvextract", "ffmpeg"]
+    required_commands = ["mkvextract", "ffmpeg"]
+    if legacy:
+        required_commands.append("HandBrakeCLI")
     if not check_dependencies(required_commands):
         input("Enterキーで終了")
         return
 
-    success = True
-    for path_str in sys.argv[1:]:
-        for mkv_file in find_files(Path(path_str), ".mkv"):
-            try:
-                if not process_mkv_file(mkv_file):
-                    success = False
-            except Exception as e:
-                print(f"エラー: {mkv_file.name} の処理中に問題が発生しました")
-                print(f"詳細: {e}")
-                success = False
+    mkv_files = [
+        mkv_file
+        for path_str in path_args
+        for mkv_file in find_files(Path(path_str), ".mkv")
+    ]
+
+    # 複数のMKVファイルを並列に処理（エンコード数はencode_slotsで全体を制限）
+    with ThreadPoolExecutor(max_workers=MKV_CONCURRENCY) as executor:
+        results = list(
+            executor.map(
+                functools.partial(try_process_mkv_file, legacy=legacy), mkv_files
+            )
+        )
+    success = all(results)
 
     print("\n処理が完了しました")
     if not success:
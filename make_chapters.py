@@ -1,10 +1,11 @@
 import csv
 import shutil
-import subprocess
 import sys
 import xml.etree.ElementTree as ET
 from pathlib import Path
 
+from utils import extract_mkv_chapters, write_xml
+
 
 def check_mkvextract() -> bool:
     """mkvextractコマンドが利用可能かチェックする"""
@@ -52,24 +53,15 @@ def extract_chapters(mkv_file: Path) -> None:
     print(f'"{mkv_file.name}"からチャプター情報を抽出しています...')
 
     try:
-        result = subprocess.run(
-            ["mkvextract", str(mkv_file), "chapters", str(output_file)],
-            encoding="utf-8",
-            capture_output=True,
-            text=True,
-        )
-
-        if result.returncode == 0:
-            if output_file.exists():
-                print(f'チャプター情報を"{output_file.name}"に保存しました')
-                # XMLファイルからCSVを作成
-                create_chapter_csv(output_file)
-            else:
-                print(f'"{mkv_file.name}"にはチャプター情報が存在しません')
+        chapters = extract_mkv_chapters(mkv_file)
+        if chapters is not None:
+            ET.indent(chapters)
+            write_xml(chapters, output_file)
+            print(f'チャプター情報を"{output_file.name}"に保存しました')
+            # XMLファイルからCSVを作成
+            create_chapter_csv(output_file)
         else:
-            print(f'エラーが発生しました: "{mkv_file.name}"')
-            if result.stderr:
-                print(f"エラー詳細: {result.stderr.strip()}")
+            print(f'"{mkv_file.name}"にはチャプター情報が存在しません')
     except Exception as e:
         print(f'エラーが発生しました: "{mkv_file.name}" - {str(e)}')
     print()
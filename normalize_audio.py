@@ -1,11 +1,16 @@
-import shutil
+import argparse
+import os
 import sys
 import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import List
 
 from utils import find_video_files, normalize_audio
 
+# 正規化中の一時ファイルの接頭辞
+TEMP_FILE_PREFIX = ".normalizing_"
+
 
 def wait_for_exit():
     """終了時にユーザー入力を待つ"""
@@ -13,14 +18,57 @@ def wait_for_exit():
     sys.exit(1)
 
 
+def process_video_file(video_file: Path, two_pass: bool = True) -> bool:
+    """動画ファイルの音量を正規化して上書き（ワーカースレッドで実行）"""
+    # 一時ファイルを作成（上書きが名前の変更だけで済むよう、元のファイルと同じフォルダに作る）
+    with tempfile.NamedTemporaryFile(
+        dir=video_file.parent,
+        prefix=TEMP_FILE_PREFIX,
+        suffix=video_file.suffix,
+        delete=False,
+    ) as tmp:
+        temp_file = Path(tmp.name)
+
+    try:
+        # 一時ファイルとして正規化を実行
+        normalize_audio(video_file, temp_file, two_pass)
+        # 正規化したファイルで元のファイルを上書き
+        os.replace(temp_file, video_file)
+        return True
+    except Exception as e:
+        print(
+            f"エラー: {video_file.name} の処理中にエラーが発生しました\n"
+            f"エラー内容: {str(e)}"
+        )
+        if temp_file.exists():
+            temp_file.unlink()
+        return False
+
+
 def main():
+    parser = argparse.ArgumentParser(description="動画の音量を正規化します")
+    parser.add_argument("paths", nargs="*", help="入力ファイル/フォルダ")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        # ffmpegも内部でスレッドを使うため、コア数の半分を既定値にする
+        default=max(1, (os.cpu_count() or 1) // 2),
+        help="同時に処理するファイル数",
+    )
+    parser.add_argument(
+        "--fast",
+        action="store_true",
+        help="ラウドネスの測定を省略し、1パスで正規化する（精度より速度を優先）",
+    )
+    args = parser.parse_args()
+
     # コマンドライン引数をチェック
-    if len(sys.argv) < 2:
+    if not args.paths:
         print("使用方法: python normalize_audio.py <入力ファイル/フォルダ...>")
         wait_for_exit()
 
     # 入力パスのリストを取得
-    input_paths = [Path(path) for path in sys.argv[1:]]
+    input_paths = [Path(path) for path in args.paths]
 
     # 存在しないパスをチェック
     invalid_paths = [path for path in input_paths if not path.exists()]
@@ -33,7 +81,12 @@ def main():
     # すべての入力パスから動画ファイルを検索
     video_files: List[Path] = []
     for path in input_paths:
-        video_files.extend(list(find_video_files(path)))
+        # 中断されて残った一時ファイルは書き込み途中のため対象にしない
+        video_files.extend(
+            video_file
+            for video_file in find_video_files(path)
+            if not video_file.name.startswith(TEMP_FILE_PREFIX)
+        )
 
     if not video_files:
         print("動画ファイルが見つかりませんでした。")
@@ -41,26 +94,16 @@ def main():
 
     print(f"処理対象の動画ファイル数: {len(video_files)}")
 
-    # 各動画ファイルを処理
-    for i, video_file in enumerate(video_files, 1):
-        print(f"処理中 [{i}/{len(video_files)}]: {video_file}")
-
-        # 一時ファイルを作成
-        with tempfile.NamedTemporaryFile(suffix=video_file.suffix, delete=False) as tmp:
-            temp_file = Path(tmp.name)
-
-        try:
-            # 一時ファイルとして正規化を実行
-            normalize_audio(video_file, temp_file)
-            # 正規化したファイルで元のファイルを上書き
-            shutil.move(temp_file, video_file, shutil.copy2)
-            print(f"完了: {video_file.name}\n")
-        except Exception as e:
-            print(f"エラー: {video_file.name} の処理中にエラーが発生しました")
-            print(f"エラー内容: {str(e)}")
-            if temp_file.exists():
-                temp_file.unlink()
-            continue
+    # 各動画ファイルを並列に処理（処理はffmpegのサブプロセスなのでスレッドで十分）
+    workers = max(1, min(args.workers, len(video_files)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_video_file, video_file, not args.fast): video_file
+            for video_file in video_files
+        }
+        for i, future in enumerate(as_completed(futures), 1):
+            if future.result():
+                print(f"完了 [{i}/{len(video_files)}]: {futures[future].name}\n")
 
     print("すべての処理が完了しました")
     wait_for_exit()
@@ -1,58 +1,284 @@
+import functools
+import json
+import os
+import shutil
 import subprocess
+import threading
+import xml.etree.ElementTree as ET
+from collections import deque
 from pathlib import Path
-from typing import Iterator, List, Optional
+from typing import (
+    IO,
+    Any,
+    BinaryIO,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    MutableSequence,
+    Optional,
+    Set,
+    Tuple,
+)
 
 from dotenv import load_dotenv
-from ffmpeg_normalize import FFmpegNormalize
 from pymediainfo import MediaInfo
 
 load_dotenv()
 TEST_MODE = os.getenv("TEST_MODE", "false").lower() == "true"
 
-
-def normalize_audio(input_file: Path, output_file: Path) -> None:
-    """音量を正規化"""
+# 動画として扱う拡張子（MediaInfoでの解析を省略する）
+VIDEO_EXTENSIONS = frozenset(
+    {".mkv", ".mp4", ".mov", ".avi", ".webm", ".ts", ".m4v", ".wmv", ".flv"}
+)
+
+# 動画ではないことが明らかな拡張子
+NON_VIDEO_EXTENSIONS = frozenset(
+    {
+        ".txt",
+        ".csv",
+        ".xml",
+        ".json",
+        ".pbf",
+        ".srt",
+        ".ass",
+        ".jpg",
+        ".jpeg",
+        ".png",
+        ".gif",
+        ".webp",
+        ".mp3",
+        ".m4a",
+        ".aac",
+        ".flac",
+        ".wav",
+        ".ogg",
+        ".opus",
+    }
+)
+
+# 出力を読み取るパイプのバッファサイズ
+PIPE_BUFFER_SIZE = 1 << 20
+
+# 保持する標準エラー出力の行数（エンコードの進捗表示でメモリを使い切らないため）
+STDERR_TAIL_LINES = 500
+
+# 低優先度で実行する際のnice値（POSIXのみ）
+LOW_PRIORITY_NICE = 10
+
+# クォートが必要なパス文字
+PATH_CHARS = frozenset(r"\/.:")
+
+# 音量正規化の目標値（統合ラウドネス・ラウドネスレンジ・トゥルーピーク）
+LOUDNORM_I = -5
+LOUDNORM_LRA = 7
+LOUDNORM_TP = 0
+LOUDNORM_TARGET = f"I={LOUDNORM_I}:LRA={LOUDNORM_LRA}:TP={LOUDNORM_TP}"
+
+# サンプルレートを取得できなかった音声トラックの出力サンプルレート
+DEFAULT_SAMPLE_RATE = 48000
+
+# 音量正規化時の出力オプション（音声はAAC、字幕・メタデータ・チャプターは除去）
+NORMALIZE_OUTPUT_OPTIONS = (
+    "-c:a",
+    "aac",
+    "-b:a",
+    "128k",
+    "-sn",
+    "-map_metadata",
+    "-1",
+    "-map_chapters",
+    "-1",
+    "-movflags",
+    "faststart",
+)
+
+# MKV (EBML) の要素ID
+EBML_HEADER_ID = 0x1A45DFA3
+SEGMENT_ID = 0x18538067
+SEEK_HEAD_ID = 0x114D9B74
+SEEK_ID = 0x4DBB
+SEEK_ID_ID = 0x53AB
+SEEK_POSITION_ID = 0x53AC
+CHAPTERS_ID = 0x1043A770
+CLUSTER_ID = 0x1F43B675
+
+# チャプター内で読み飛ばす要素 (Void, CRC-32)
+IGNORED_ELEMENT_IDS = frozenset({0xEC, 0xBF})
+
+# チャプターの要素ID → (mkvextractが出力するXMLでの名前, 値の型)
+CHAPTER_ELEMENTS = {
+    0x45B9: ("EditionEntry", "master"),
+    0x45BC: ("EditionUID", "uint"),
+    0x45BD: ("EditionFlagHidden", "uint"),
+    0x45DB: ("EditionFlagDefault", "uint"),
+    0x45DD: ("EditionFlagOrdered", "uint"),
+    0xB6: ("ChapterAtom", "master"),
+    0x73C4: ("ChapterUID", "uint"),
+    0x91: ("ChapterTimeStart", "time"),
+    0x92: ("ChapterTimeEnd", "time"),
+    0x98: ("ChapterFlagHidden", "uint"),
+    0x4598: ("ChapterFlagEnabled", "uint"),
+    0x80: ("ChapterDisplay", "master"),
+    0x85: ("ChapterString", "string"),
+    0x437C: ("ChapterLanguage", "string"),
+    0x437D: ("ChapLanguageIETF", "string"),
+    0x437E: ("ChapterCountry", "string"),
+}
+
+# XMLファイルの書き込みバッファサイズ
+XML_WRITE_BUFFER_SIZE = 1 << 20
+
+# 一度に読み込むSeekHead・Chapters要素の最大サイズ
+MAX_EBML_ELEMENT_SIZE = 16 << 20
+
+
+def normalize_audio(input_file: Path, output_file: Path, two_pass: bool = True) -> None:
+    """音量を正規化（two_pass=Falseでは測定を省略し、音声のデコードを1回で済ませる）"""
 
     print(f"音量正規化開始: {input_file.name}")
 
-    normalizer = FFmpegNormalize(
-        normalization_type="ebu",
-        target_level=-5,
-        print_stats=TEST_MODE,
-        loudness_range_target=7,
-        keep_loudness_range_target=True,
-        keep_lra_above_loudness_range_target=False,
-        true_peak=0,
-        offset=0,
-        lower_only=False,
-        auto_lower_loudness_target=True,
-        dual_mono=False,
-        dynamic=False,
-        audio_codec="aac",
-        audio_bitrate=128000,
-        sample_rate=None,
-        audio_channels=None,
-        keep_original_audio=False,
-        pre_filter=None,
-        post_filter=None,
-        video_codec="copy",
-        video_disable=False,
-        subtitle_disable=True,
-        metadata_disable=True,
-        chapters_disable=True,
-        extra_input_options=None,
-        extra_output_options=["-movflags", "faststart"],
-        output_format=None,
-        dry_run=False,
-        debug=False,
-        progress=TEST_MODE,
+    sample_rates = get_audio_sample_rates(input_file)
+    if not sample_rates:
+        raise RuntimeError(f"音声トラックが見つかりません: {input_file}")
+
+    # 映像はコピーし、全ての音声トラックをそれぞれ補正
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-y"]
+    cmd.extend(["-i", str(input_file)])
+    cmd.extend(["-map", "0:v?", "-map", "0:a"])
+    cmd.extend(["-c:v", "copy"])
+    for index, sample_rate in enumerate(sample_rates):
+        if two_pass:
+            # 1パス目: トラックごとにラウドネスを測定
+            measured = measure_loudness(input_file, stream_index=index)
+            if measured is None:
+                raise RuntimeError(f"ラウドネス測定に失敗しました: {input_file}")
+            if TEST_MODE:
+                print(f"ラウドネス測定結果 (音声{index}): {measured}")
+            audio_filter = get_loudnorm_filter(measured)
+        else:
+            # 測定値を使わず、loudnormの動的な補正のみで正規化
+            audio_filter = f"loudnorm={LOUDNORM_TARGET}"
+
+        # loudnormは動的な補正では192kHzで出力するため、元のサンプルレートに戻す
+        cmd.extend([f"-filter:a:{index}", audio_filter])
+        cmd.extend([f"-ar:a:{index}", str(sample_rate)])
+    cmd.extend(NORMALIZE_OUTPUT_OPTIONS)
+    cmd.append(str(output_file))
+
+    result = run_command(
+        cmd=cmd,
+        description="音量正規化",
+        capture_output=True,
+        capture_stdout=False,
+        path=input_file,
     )
-    normalizer.add_media_file(str(input_file), str(output_file))
-    normalizer.run_normalization()
+    if result is None:
+        raise RuntimeError(f"音量正規化に失敗しました: {input_file}")
 
     print(f"音量正規化完了: {output_file.name}")
 
 
+def get_audio_sample_rates(input_file: Path) -> List[int]:
+    """各音声トラックのサンプルレートを取得"""
+    cmd = ["ffprobe", "-v", "error", "-select_streams", "a"]
+    cmd.extend(["-show_entries", "stream=sample_rate", "-of", "json"])
+    cmd.append(str(input_file))
+
+    result = run_command(
+        cmd=cmd,
+        description="音声トラック情報取得",
+        capture_output=True,
+        path=input_file,
+    )
+    if result is None:
+        return []
+
+    try:
+        streams = json.loads(result.stdout).get("streams", [])
+    except ValueError:
+        return []
+    return [int(stream.get("sample_rate") or DEFAULT_SAMPLE_RATE) for stream in streams]
+
+
+def measure_loudness(
+    input_file: Path,
+    input_options: Optional[List[str]] = None,
+    stream_index: int = 0,
+) -> Optional[Dict[str, str]]:
+    """loudnormフィルターで指定した音声トラックのラウドネスを測定"""
+    cmd = ["ffmpeg", "-hide_banner", "-nostats"]
+    cmd.extend(input_options or [])
+    cmd.extend(["-i", str(input_file), "-map", f"0:a:{stream_index}"])
+    cmd.extend(["-af", f"loudnorm={LOUDNORM_TARGET}:print_format=json"])
+    cmd.extend(["-f", "null", "-"])
+
+    result = run_command(
+        cmd=cmd,
+        description="ラウドネス測定",
+        capture_output=True,
+        capture_stdout=False,
+        path=input_file,
+    )
+    if result is None:
+        return None
+
+    # 測定結果は標準エラー出力の末尾にJSONで出力される
+    stderr = result.stderr
+    try:
+        return json.loads(stderr[stderr.rfind("{") : stderr.rfind("}") + 1])
+    except ValueError:
+        print(f"エラー: ラウドネス測定結果を解析できません: {input_file}")
+        return None
+
+
+def clamp(value: float, lower: float, upper: float) -> float:
+    """値を指定した範囲に収める"""
+    return max(lower, min(upper, value))
+
+
+def get_loudnorm_filter(measured: Dict[str, str]) -> str:
+    """測定結果を使って音量を補正するloudnormフィルターを生成"""
+    # loudnormが受け付ける範囲に収める（無音では-infになる）
+    input_i = clamp(float(measured["input_i"]), -99, 0)
+    input_lra = clamp(float(measured["input_lra"]), 0, 99)
+    input_tp = clamp(float(measured["input_tp"]), -99, 99)
+    input_thresh = clamp(float(measured["input_thresh"]), -99, 0)
+    offset = clamp(float(measured["target_offset"]), -99, 99)
+
+    # 線形補正のまま処理されるよう、ffmpeg-normalizeと同様に目標値を調整する
+    # (keep_loudness_range_target: ラウドネスレンジは入力の値を維持)
+    target_lra = clamp(input_lra, 1, 50)
+    # (auto_lower_loudness_target: 補正後のピークが上限を超えないよう目標を下げる)
+    target_i = clamp(input_i - input_tp + LOUDNORM_TP - 0.1, -70, LOUDNORM_I)
+
+    return (
+        f"loudnorm=I={target_i:.2f}:LRA={target_lra:.2f}:TP={LOUDNORM_TP}"
+        f":measured_I={input_i:.2f}"
+        f":measured_LRA={input_lra:.2f}"
+        f":measured_TP={input_tp:.2f}"
+        f":measured_thresh={input_thresh:.2f}"
+        f":offset={offset:.2f}"
+        ":linear=true"
+    )
+
+
+def scan_files(directory: Path) -> Iterator[os.DirEntry]:
+    """ディレクトリ以外のエントリを再帰的に列挙（scandirの種別情報でstatを省略）"""
+    directories = [str(directory)]
+    while directories:
+        try:
+            with os.scandir(directories.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        directories.append(entry.path)
+                    else:
+                        yield entry
+        except OSError:
+            # 読めないフォルダや走査中に削除されたフォルダはスキップ
+            continue
+
+
 def find_files(path: Path, suffix: str) -> Iterator[Path]:
     """指定されたパスから指定された拡張子のファイルを再帰的に検索"""
 
@@ -60,10 +286,12 @@ def find_files(path: Path, suffix: str) -> Iterator[Path]:
     if path.is_file() and path.suffix.lower() == suffix:
         yield path
     elif path.is_dir():
+        # ファイル名全体ではなく、末尾の拡張子部分だけを小文字にして比較
+        suffix_length = len(suffix)
         yield from (
-            item
-            for item in path.rglob("*")
-            if item.is_file() and item.suffix.lower() == suffix
+            Path(entry.path)
+            for entry in scan_files(path)
+            if entry.name[-suffix_length:].lower() == suffix and entry.is_file()
         )
 
 
@@ -74,45 +302,122 @@ def find_video_files(path: Path) -> Iterator[Path]:
         yield path
     elif path.is_dir():
         yield from (
-            item for item in path.rglob("*") if item.is_file() and is_video_file(item)
+            item
+            for item in (Path(entry.path) for entry in scan_files(path))
+            if is_video_file(item)
         )
 
 
 def format_command(cmd: List[str]) -> str:
     """コマンドをPowerShell用に整形"""
 
-    formatted_cmd = []
-    for arg in cmd:
-        # パス文字を含む引数はクォートで囲む
-        if any(c in arg for c in r"\/.:"):
-            formatted_cmd.append(f'"{arg}"')
-        else:
-            formatted_cmd.append(arg)
+    # パス文字を含む引数はクォートで囲む
+    formatted_cmd = [
+        f'"{arg}"' if not PATH_CHARS.isdisjoint(arg) else arg for arg in cmd
+    ]
 
     return " ".join(formatted_cmd) + "\n"
 
 
+@functools.lru_cache(maxsize=None)
+def find_command(name: str) -> Optional[str]:
+    """外部コマンドの絶対パスを取得（結果はキャッシュして再検索しない）"""
+    return shutil.which(name)
+
+
+def drain_lines(stream: IO[str], lines: MutableSequence[str]) -> None:
+    """パイプの出力を最後まで読み取る"""
+    for line in stream:
+        lines.append(line)
+
+
+def get_priority_options(low_priority: bool) -> Dict[str, Any]:
+    """子プロセスの優先度を下げるためのPopen引数を取得（Windowsのみ）"""
+    if not low_priority or os.name != "nt":
+        return {}
+    return {
+        "creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS
+        | subprocess.CREATE_NO_WINDOW
+    }
+
+
+def get_priority_prefix(low_priority: bool) -> List[str]:
+    """子プロセスの優先度を下げるためのniceコマンドを取得（Windows以外）"""
+    if not low_priority or os.name == "nt":
+        return []
+    # preexec_fnはスレッドから安全に使えないため、niceコマンド経由で実行
+    nice = find_command("nice")
+    return [nice, "-n", str(LOW_PRIORITY_NICE)] if nice else []
+
+
+def run_captured(
+    cmd: List[str], low_priority: bool = False, capture_stdout: bool = True
+) -> subprocess.CompletedProcess:
+    """出力を読み取りながらコマンドを実行（標準エラー出力は末尾のみ保持）"""
+    stdout_lines: List[str] = []
+    stderr_lines: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        bufsize=PIPE_BUFFER_SIZE,
+        text=True,
+        encoding="utf-8",
+        errors="replace",
+        **get_priority_options(low_priority),
+    ) as process:
+        if capture_stdout:
+            # 両方のパイプを同時に読まないと、片方が詰まって子プロセスが止まる
+            stderr_thread = threading.Thread(
+                target=drain_lines, args=(process.stderr, stderr_lines)
+            )
+            stderr_thread.start()
+            drain_lines(process.stdout, stdout_lines)
+            stderr_thread.join()
+        else:
+            drain_lines(process.stderr, stderr_lines)
+        returncode = process.wait()
+
+    return subprocess.CompletedProcess(
+        cmd, returncode, "".join(stdout_lines), "".join(stderr_lines)
+    )
+
+
 def run_command(
     cmd: List[str],
     description: str = "",
     capture_output: bool = False,
     path: Optional[Path] = None,
     silent: bool = False,
+    low_priority: bool = True,
+    capture_stdout: bool = True,
 ) -> Optional[subprocess.CompletedProcess]:
-    """コマンドを実行"""
+    """コマンドを実行（既定では他の処理を妨げないよう低優先度で実行）"""
 
     if TEST_MODE:
         print(f"[テストモード] {description}")
         print(f"実行コマンド:\n{format_command(cmd)}")
 
+    # PATHを毎回検索しないよう、解決済みの絶対パスで実行
+    command_path = find_command(cmd[0])
+    cmd = [command_path or cmd[0], *cmd[1:]]
+    # コマンドが見つからない場合はniceを挟まず、FileNotFoundErrorとして扱う
+    if command_path:
+        cmd = [*get_priority_prefix(low_priority), *cmd]
+
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=capture_output,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-        )
+        if capture_output:
+            # 標準出力が不要な場合は読み取らずに捨てる
+            result = run_captured(cmd, low_priority, capture_stdout)
+        else:
+            result = subprocess.run(
+                cmd,
+                text=True,
+                encoding="utf-8",
+                errors="replace",
+                **get_priority_options(low_priority),
+            )
         if result.returncode != 0:
             if not silent:
                 print(f"エラー: {description}失敗: {path}")
@@ -135,6 +440,13 @@ def is_video_file(file_path: Path) -> bool:
     if not file_path.is_file():
         return False
 
+    # 拡張子で判断できる場合はMediaInfoでの解析を省略
+    suffix = file_path.suffix.lower()
+    if suffix in VIDEO_EXTENSIONS:
+        return True
+    if suffix in NON_VIDEO_EXTENSIONS:
+        return False
+
     media_info = MediaInfo.parse(str(file_path))
 
     # ビデオトラックを探す
@@ -193,3 +505,185 @@ def get_video_duration(file_path: Path) -> Optional[float]:
         return float(result.stdout.strip())
     except ValueError:
         return None
+
+
+def read_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int]:
+    """EBMLの可変長整数を読み取り、(値, 次の位置)を返す"""
+    if pos >= len(data):
+        raise ValueError("EBMLデータが途中で終わっています")
+    length = 9 - data[pos].bit_length()
+    if length > 8 or pos + length > len(data):
+        raise ValueError("不正なEBMLの可変長整数です")
+
+    value = int.from_bytes(data[pos : pos + length], "big")
+    if not keep_marker:
+        value &= (1 << (7 * length)) - 1
+    return value, pos + length
+
+
+def read_element_header(data: bytes, pos: int) -> Tuple[int, Optional[int], int]:
+    """EBML要素のヘッダーを読み取り、(ID, サイズ, データの開始位置)を返す"""
+    element_id, pos = read_vint(data, pos, keep_marker=True)
+    size_start = pos
+    size, pos = read_vint(data, pos, keep_marker=False)
+
+    # 全ビットが1のサイズは「サイズ不明」を表す
+    if size == (1 << (7 * (pos - size_start))) - 1:
+        return element_id, None, pos
+    return element_id, size, pos
+
+
+def iter_elements(data: bytes) -> Iterator[Tuple[int, bytes]]:
+    """EBMLのマスター要素の内容から(子要素のID, データ)を列挙"""
+    pos = 0
+    while pos < len(data):
+        element_id, size, pos = read_element_header(data, pos)
+        if size is None or pos + size > len(data):
+            raise ValueError("EBML要素のサイズが不正です")
+        yield element_id, data[pos : pos + size]
+        pos += size
+
+
+def read_file_element(f: BinaryIO, offset: int) -> Tuple[int, Optional[int], int]:
+    """ファイルの指定位置にある要素のヘッダーを読み取り、(ID, サイズ, データの開始位置)を返す"""
+    f.seek(offset)
+    # IDは最大4バイト、サイズは最大8バイト
+    element_id, size, header_size = read_element_header(f.read(12), 0)
+    return element_id, size, offset + header_size
+
+
+def read_file_element_data(f: BinaryIO, offset: int, size: Optional[int]) -> bytes:
+    """ファイルから要素のデータを読み込む"""
+    if size is None or size > MAX_EBML_ELEMENT_SIZE:
+        raise ValueError("EBML要素のサイズが大きすぎます")
+    f.seek(offset)
+    return f.read(size)
+
+
+def read_seek_entries(data: bytes) -> Iterator[Tuple[int, int]]:
+    """SeekHeadの内容から(要素ID, Segment内の位置)を列挙"""
+    for element_id, seek in iter_elements(data):
+        if element_id != SEEK_ID:
+            continue
+
+        seek_id = seek_position = None
+        for child_id, value in iter_elements(seek):
+            if child_id == SEEK_ID_ID:
+                seek_id = int.from_bytes(value, "big")
+            elif child_id == SEEK_POSITION_ID:
+                seek_position = int.from_bytes(value, "big")
+        if seek_id is not None and seek_position is not None:
+            yield seek_id, seek_position
+
+
+def find_chapters_offset(f: BinaryIO) -> Optional[int]:
+    """MKVファイル内のChapters要素の位置を探す（見つからなければNone）"""
+    file_size = os.fstat(f.fileno()).st_size
+
+    element_id, size, pos = read_file_element(f, 0)
+    if element_id != EBML_HEADER_ID or size is None:
+        raise ValueError("MKVファイルではありません")
+    element_id, _, segment_start = read_file_element(f, pos + size)
+    if element_id != SEGMENT_ID:
+        raise ValueError("Segment要素が見つかりません")
+
+    # 先頭からClusterの手前まで要素を順にたどり、見つからなければSeekHeadの参照先を探す
+    # (mkvpropeditで書き換えたチャプターはファイルの末尾に移動していることがある)
+    offsets = [segment_start]
+    visited: Set[int] = set()
+    seek_head_found = False
+    reached_cluster = False
+    while offsets:
+        offset = offsets.pop()
+        while offset < file_size and offset not in visited:
+            visited.add(offset)
+            element_id, size, data_start = read_file_element(f, offset)
+            if element_id == CHAPTERS_ID:
+                return offset
+            if element_id == CLUSTER_ID or size is None:
+                reached_cluster = True
+                break
+            if element_id == SEEK_HEAD_ID:
+                seek_head_found = True
+                data = read_file_element_data(f, data_start, size)
+                for seek_id, position in read_seek_entries(data):
+                    if seek_id in (CHAPTERS_ID, SEEK_HEAD_ID):
+                        offsets.append(segment_start + position)
+            offset = data_start + size
+
+    # SeekHeadが無いとClusterより後ろのチャプターを探せないため、直接は読み取れない
+    if reached_cluster and not seek_head_found:
+        raise ValueError("SeekHeadが無いため、チャプターの位置を特定できません")
+    return None
+
+
+def format_chapter_time(nanoseconds: int) -> str:
+    """ナノ秒をmkvextractと同じ 00:00:00.000000000 形式に変換"""
+    seconds, nanoseconds = divmod(nanoseconds, 1_000_000_000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{nanoseconds:09d}"
+
+
+def build_chapter_xml(data: bytes, parent: ET.Element) -> None:
+    """チャプターのEBMLデータをXML要素に変換して親要素に追加"""
+    for element_id, value in iter_elements(data):
+        if element_id in IGNORED_ELEMENT_IDS:
+            continue
+        # 書き戻し時に情報が欠けないよう、未対応の要素があれば変換しない
+        if element_id not in CHAPTER_ELEMENTS:
+            raise ValueError(f"未対応のチャプター要素です: 0x{element_id:X}")
+
+        name, value_type = CHAPTER_ELEMENTS[element_id]
+        element = ET.SubElement(parent, name)
+        if value_type == "master":
+            build_chapter_xml(value, element)
+        elif value_type == "uint":
+            element.text = str(int.from_bytes(value, "big"))
+        elif value_type == "time":
+            element.text = format_chapter_time(int.from_bytes(value, "big"))
+        else:
+            element.text = value.rstrip(b"\0").decode("utf-8")
+
+
+def write_xml(root: ET.Element, xml_path: Path) -> None:
+    """XMLをファイルに保存（既定より大きいバッファで書き込み回数を減らす）"""
+    with open(xml_path, "wb", buffering=XML_WRITE_BUFFER_SIZE) as f:
+        ET.ElementTree(root).write(f, encoding="utf-8", xml_declaration=True)
+
+
+def read_mkv_chapters(mkv_file: Path) -> Optional[ET.Element]:
+    """mkvextractを使わずにMKVファイルのチャプターを読み取り、同じ形式のXMLに変換"""
+    # チャプターが無ければNone、直接読み取れない構造であればValueErrorとする
+    with mkv_file.open("rb") as f:
+        offset = find_chapters_offset(f)
+        if offset is None:
+            return None
+        _, size, data_start = read_file_element(f, offset)
+        data = read_file_element_data(f, data_start, size)
+
+    root = ET.Element("Chapters")
+    build_chapter_xml(data, root)
+    return root if len(root) else None
+
+
+def extract_mkv_chapters(mkv_file: Path) -> Optional[ET.Element]:
+    """MKVファイルのチャプターを取得（直接読み取れない場合のみmkvextractを使う）"""
+    try:
+        # mkvextractを起動せず、EBMLの構造をたどってチャプターを直接読み取る
+        return read_mkv_chapters(mkv_file)
+    except ValueError:
+        pass
+
+    result = run_command(
+        cmd=["mkvextract", str(mkv_file), "chapters"],
+        description="チャプター抽出",
+        capture_output=True,
+        path=mkv_file,
+    )
+    if result is None:
+        raise RuntimeError(f"チャプター抽出に失敗しました: {mkv_file}")
+    # チャプターが無い場合、mkvextractは何も出力しない
+    if not result.stdout.strip():
+        return None
+    return ET.fromstring(result.stdout)
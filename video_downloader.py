@@ -1,8 +1,9 @@
 import argparse
 import os
 import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from dotenv import load_dotenv
 from yt_dlp import YoutubeDL
@@ -19,12 +20,32 @@ DOWNLOAD_ARCHIVE_PATH = (
     else None
 )
 
+# ダウンロードと並行して音量正規化するファイル数
+NORMALIZE_WORKERS = max(1, int(os.getenv("NORMALIZE_WORKERS", "2")))
 
-def download_video(url: str, output_dir: Path) -> bool:
-    """yt-dlpを使用して動画をダウンロードする"""
-    # 一時ディレクトリを作成
-    with tempfile.TemporaryDirectory() as temp_dir:
+
+def download_videos(urls: List[str], output_dir: Path) -> bool:
+    """yt-dlpを使用して動画をダウンロードする（複数のURLを1つのYoutubeDLでまとめて処理）"""
+    # 出力先と同じドライブに一時ディレクトリを作成（/tmpなど別ドライブへの書き込みを省く）
+    # (音量正規化の完了を待ってから一時ディレクトリを削除するよう、executorを後に開く)
+    with tempfile.TemporaryDirectory(
+        prefix=".tmp_dl_", dir=output_dir
+    ) as temp_dir, ThreadPoolExecutor(
+        max_workers=NORMALIZE_WORKERS
+    ) as executor:
         temp_path = Path(temp_dir)
+        futures: List[Future] = []
+
+        def on_postprocess(d: Dict[str, Any]) -> None:
+            """結合済みのファイルが揃ったら、次のダウンロード中に音量正規化を開始"""
+            if d["status"] == "finished" and d["postprocessor"] == "MoveFiles":
+                video_file = Path(d["info_dict"]["filepath"])
+                # 音量正規化を実行(直接output_dirに出力)
+                futures.append(
+                    executor.submit(
+                        normalize_audio, video_file, output_dir / video_file.name
+                    )
+                )
 
         ydl_opts: Dict[str, Any] = {
             "format_sort": ["codec:avc:aac", "res:1080", "fps:60", "hdr:sdr"],
@@ -33,6 +54,7 @@ def download_video(url: str, output_dir: Path) -> bool:
                 temp_path
                 / "%(title)s_%(height)s_%(fps)s_%(vcodec.:4)s_(%(id)s).%(ext)s"
             ),
+            "postprocessor_hooks": [on_postprocess],
         }
 
         # DOWNLOAD_ARCHIVE_PATHが設定されており、かつファイルが存在する場合のみdownload_archiveオプションを追加
@@ -41,12 +63,11 @@ def download_video(url: str, output_dir: Path) -> bool:
 
         try:
             with YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+                ydl.download(urls)
 
-                # ダウンロードしたファイルを処理
-                for video_file in temp_path.glob("*"):
-                    # 音量正規化を実行(直接output_dirに出力)
-                    normalize_audio(video_file, output_dir / video_file.name)
+            # 残りの音量正規化の完了を待つ
+            for future in futures:
+                future.result()
 
             return True
         except Exception as e:
@@ -56,12 +77,12 @@ def download_video(url: str, output_dir: Path) -> bool:
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="動画をダウンロードします")
-    parser.add_argument("url", help="ダウンロードする動画のURL")
+    parser.add_argument("urls", nargs="+", help="ダウンロードする動画のURL")
     args = parser.parse_args()
 
     output_dir = Path.cwd()
 
-    if download_video(args.url, output_dir):
+    if download_videos(args.urls, output_dir):
         print("ダウンロードが完了しました")
     else:
         print("ダウンロードに失敗しました")
@@ -1,38 +1,51 @@
 import csv
+import itertools
+import os
 import subprocess
 import sys
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List
 
+from utils import find_files, write_xml
+
 
 def update_chapter_xml(csv_path: Path, xml_path: Path) -> None:
     """CSVの内容でXMLのチャプター名を更新する"""
     # CSVからチャプター情報を読み取る
     chapters: Dict[str, str] = {}  # TimeStart をキーにしてChapterNameを格納
     with open(csv_path, encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        # 行ごとに辞書を作らないよう、列の位置はヘッダーから1回だけ求める
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:  # 空のCSVでは何もしない
+            return
+        time_start_index = header.index("TimeStart")
+        name_index = header.index("ChapterName")
         for row in reader:
-            chapters[row["TimeStart"]] = row["ChapterName"]
-
-    # 既存のXMLを読み込む
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
-    # 各チャプターを検索して更新
-    for chapter_atom in root.findall(".//ChapterAtom"):
-        time_start = chapter_atom.find("ChapterTimeStart").text
-        if time_start not in chapters:
+            if not row:  # DictReaderと同様に空行は読み飛ばす
+                continue
+            chapters[row[time_start_index]] = row[name_index]
+
+    # 既存のXMLを読み込みながら、ChapterAtomを読み終えた時点で更新
+    # (XML全体を書き戻すため、処理済みの要素は破棄しない)
+    events = ET.iterparse(xml_path, events=("end",))
+    for _, chapter_atom in events:
+        if chapter_atom.tag != "ChapterAtom":
+            continue
+        new_name = chapters.get(chapter_atom.findtext("ChapterTimeStart"))
+        if new_name is None:
             continue
 
-        chapter_string = chapter_atom.find("./ChapterDisplay/ChapterString")
-        new_name = chapters[time_start]
+        # パス指定のfindはXPathの解釈を挟むため、子要素をタグ名で1段ずつたどる
+        chapter_string = chapter_atom.find("ChapterDisplay").find("ChapterString")
         if chapter_string.text != new_name:
             chapter_string.text = new_name
 
     # XMLを保存
-    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-    print("チャプターファイルを更新しました")
+    write_xml(events.root, xml_path)
+    print(f"チャプターファイルを更新しました: {xml_path.name}")
 
 
 def write_chapters_to_mkv(mkv_path: Path, xml_path: Path, csv_path: Path) -> None:
@@ -41,12 +54,12 @@ def write_chapters_to_mkv(mkv_path: Path, xml_path: Path, csv_path: Path) -> Non
         subprocess.run(
             ["mkvpropedit", str(mkv_path), "--chapters", str(xml_path)], check=True
         )
-        print("チャプターの書き込みが完了しました")
+        print(f"チャプターの書き込みが完了しました: {mkv_path.name}")
 
         # チャプターファイルを削除
         xml_path.unlink()
         csv_path.unlink()
-        print("チャプターファイルを削除しました")
+        print(f"チャプターファイルを削除しました: {xml_path.name}, {csv_path.name}")
 
     except subprocess.CalledProcessError as e:
         print(f"エラー: チャプターの書き込みに失敗しました: {e}")
@@ -77,8 +90,8 @@ def check_required_files(csv_path: Path, xml_path: Path) -> bool:
     return True
 
 
-def process_mkv_file(mkv_path: Path, index: int, total: int) -> None:
-    """MKVファイルのチャプター情報を処理する"""
+def prepare_chapter_file(mkv_path: Path, index: int, total: int) -> bool:
+    """MKVファイルに書き込むチャプターファイルを準備する"""
     print(f"\n処理: [{index}/{total}] {mkv_path.name}")
 
     # CSVとXMLのパスを設定
@@ -86,24 +99,21 @@ def process_mkv_file(mkv_path: Path, index: int, total: int) -> None:
 
     # 必要なファイルが揃っているかチェック
     if not check_required_files(csv_path, xml_path):
-        return
-
-    # XMLファイルを更新
-    update_chapter_xml(csv_path, xml_path)
+        return False
 
-    # MKVファイルにチャプターを書き込む
-    write_chapters_to_mkv(mkv_path, xml_path, csv_path)
+    # XMLファイルを更新（1ファイルの失敗で他のファイルの処理を止めない）
+    try:
+        update_chapter_xml(csv_path, xml_path)
+    except Exception as e:
+        print(f"エラー: チャプターファイルの更新に失敗しました: {mkv_path.name}: {e}")
+        return False
+    return True
 
 
 def find_mkv_files(path: Path) -> List[Path]:
     """指定されたパスからMKVファイルを再帰的に検索する"""
-    if path.is_file():
-        return [path] if path.suffix.lower() == ".mkv" else []
-
-    mkv_files = []
-    for item in path.rglob("*.mkv"):
-        mkv_files.append(item)
-    return mkv_files
+    # rglobではなくscandirで走査し、エントリごとのstatを省く
+    return list(find_files(path, ".mkv"))
 
 
 def main() -> None:
@@ -130,10 +140,31 @@ def main() -> None:
         print("処理対象のMKVファイルが見つかりません")
         return
 
-    # 収集した全てのMKVファイルを処理
+    # 収集した全てのMKVファイルを並列に処理（ファイルごとに独立しているため）
     print(f"\n合計 {len(mkv_files)} 個のMKVファイルを処理します")
-    for i, mkv_file in enumerate(mkv_files, 1):
-        process_mkv_file(mkv_file, i, len(mkv_files))
+    total = len(mkv_files)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        # 1段階目: 全ファイルのチャプターXMLを先に更新
+        prepared = list(
+            executor.map(
+                prepare_chapter_file,
+                mkv_files,
+                range(1, total + 1),
+                itertools.repeat(total),
+            )
+        )
+
+        # 2段階目: 準備できたファイルにmkvpropeditをまとめて並列に実行
+        futures = []
+        for mkv_file, is_prepared in zip(mkv_files, prepared, strict=True):
+            if not is_prepared:
+                continue
+            csv_path, xml_path = get_chapter_paths(mkv_file)
+            futures.append(
+                executor.submit(write_chapters_to_mkv, mkv_file, xml_path, csv_path)
+            )
+        for future in futures:
+            future.result()
 
     print("\n全ての処理が完了しました")
     print("\n何かキーを押すと終了します")
@@ -1,11 +1,15 @@
 import csv
+import os
 import subprocess
 import sys
 import tempfile
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Union
 
+from utils import extract_mkv_chapters, find_files, write_xml
+
 
 def timestamp_to_seconds(timestamp: str) -> float:
     """00:00:00.000000000 形式のタイムスタンプを秒数に変換"""
@@ -15,15 +19,32 @@ def timestamp_to_seconds(timestamp: str) -> float:
     return round(total_seconds, 6)
 
 
+def seconds_to_timestamp(seconds: float) -> str:
+    """秒数を 00:00:00.000000000 形式のタイムスタンプに変換（小数点以下6桁で丸め）"""
+    total_microseconds = round(seconds * 1_000_000)
+    total_seconds, microseconds = divmod(total_microseconds, 1_000_000)
+    minutes, secs = divmod(total_seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{microseconds:06d}000"
+
+
 def read_chapters_from_csv(csv_path: Path) -> List[Dict[str, Union[float, str]]]:
     """CSVファイルからチャプター情報を読み込む"""
     chapters = []
     with open(csv_path, "r", encoding="utf-8") as f:
-        reader = csv.DictReader(f)
+        # 行ごとに辞書を作らないよう、列の位置はヘッダーから1回だけ求める
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:  # 空のCSVでは何もしない
+            return chapters
+        start_index = header.index("start")
+        title_index = header.index("title")
         for row in reader:
-            start_time = float(row["start"])
+            if not row:  # DictReaderと同様に空行は読み飛ばす
+                continue
+            start_time = float(row[start_index])
             # タイトルからYYMMDD_形式のプレフィックスを削除
-            title = row["title"]
+            title = row[title_index]
             if len(title) > 7 and title[6] == "_" and title[:6].isdigit():
                 title = title[7:]
             chapters.append({"start": start_time, "title": title})
@@ -31,48 +52,51 @@ def read_chapters_from_csv(csv_path: Path) -> List[Dict[str, Union[float, str]]]
 
 
 def update_xml_chapters(
-    xml_path: Path, chapters: List[Dict[str, Union[float, str]]]
+    root: ET.Element, chapters: List[Dict[str, Union[float, str]]]
 ) -> None:
-    """XMLファイルのチャプター情報を更新"""
-    tree = ET.parse(xml_path)
-    root = tree.getroot()
-
+    """XMLのチャプター情報を更新"""
     # チャプターの開始時間とタイトルのマッピングを作成
-    chapter_map = {chapter["start"]: chapter["title"] for chapter in chapters}
+    # (XMLと同じ形式の文字列をキーにして、チャプターごとの秒数への変換を省く)
+    chapter_map = {
+        seconds_to_timestamp(chapter["start"]): chapter["title"] for chapter in chapters
+    }
 
     # 全てのChapterAtomを検索して処理
-    for chapter in root.findall(".//ChapterAtom"):
+    for chapter in root.iter("ChapterAtom"):
         time_start = chapter.find("ChapterTimeStart").text
-        seconds = timestamp_to_seconds(time_start)
+        # マイクロ秒未満の端数がある場合のみ、秒数に変換して丸める
+        if not time_start.endswith("000"):
+            time_start = seconds_to_timestamp(timestamp_to_seconds(time_start))
 
-        # 対応する秒数が見つかった場合、タイトルを更新
-        matching_title = chapter_map.get(seconds)
+        # 対応する開始時間が見つかった場合、タイトルを更新
+        matching_title = chapter_map.get(time_start)
         if matching_title:
             chapter.find("ChapterDisplay/ChapterString").text = matching_title
 
-    # XMLを保存
-    tree.write(xml_path, encoding="utf-8", xml_declaration=True)
-
 
-def extract_chapters(mkv_path: Path, xml_path: Path) -> None:
+def extract_chapters(mkv_path: Path) -> ET.Element:
     """MKVファイルからチャプター情報をXMLとして抽出"""
-    result = subprocess.run(
-        ["mkvextract", str(mkv_path), "chapters"],
-        capture_output=True,
-        encoding="utf-8",
-        errors="replace",
-    )
-    if result.returncode != 0:
-        raise Exception(f"チャプター抽出エラー: {result.stderr}")
+    chapters = extract_mkv_chapters(mkv_path)
+    if chapters is None:
+        raise Exception("チャプター抽出エラー: チャプター情報が存在しません")
+
+    return chapters
 
-    # 出力を一時XMLファイルに保存
-    with open(xml_path, "w", encoding="utf-8") as f:
-        f.write(result.stdout)
 
+def write_chapters(mkv_path: Path, chapters: ET.Element) -> None:
+    """チャプター情報をMKVファイルに書き戻す"""
+    # mkvpropeditはファイルからしかチャプターを読み込めないため、一時ファイルを経由する
+    with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as temp_file:
+        temp_xml = Path(temp_file.name)
+
+    try:
+        write_xml(chapters, temp_xml)
+        result = subprocess.run(
+            ["mkvpropedit", str(mkv_path), "--chapters", str(temp_xml)]
+        )
+    finally:
+        temp_xml.unlink(missing_ok=True)
 
-def write_chapters(mkv_path: Path, xml_path: Path) -> None:
-    """XMLファイルのチャプター情報をMKVファイルに書き戻す"""
-    result = subprocess.run(["mkvpropedit", str(mkv_path), "--chapters", str(xml_path)])
     if result.returncode != 0:
         raise Exception("チャプター書き込みエラー")
 
@@ -91,25 +115,18 @@ def process_mkv_file(mkv_path: Path) -> bool:
         return False
 
     try:
-        # 一時XMLファイルのパスを設定
-        with tempfile.NamedTemporaryFile(suffix=".xml", delete=False) as temp_file:
-            temp_xml = Path(temp_file.name)
-
         # チャプター抽出
         print(f"処理中: {mkv_path.name}")
         print("チャプター情報を抽出中...")
-        extract_chapters(mkv_path, temp_xml)
+        root = extract_chapters(mkv_path)
 
         # チャプター更新
         print("チャプター情報を更新中...")
         chapters = read_chapters_from_csv(csv_path)
-        update_xml_chapters(temp_xml, chapters)
+        update_xml_chapters(root, chapters)
 
         # チャプター書き戻し
-        write_chapters(mkv_path, temp_xml)
-
-        # 一時ファイルを削除
-        temp_xml.unlink()
+        write_chapters(mkv_path, root)
 
         # CSVファイルを削除
         csv_path.unlink()
@@ -119,22 +136,19 @@ def process_mkv_file(mkv_path: Path) -> bool:
 
     except Exception as e:
         print(f"  エラーが発生しました: {str(e)}")
-        if temp_xml.exists():
-            temp_xml.unlink()
         return False
 
 
 def process_directory(directory: Path) -> Tuple[int, int]:
     """ディレクトリ内のMKVファイルを再帰的に処理"""
-    success_count = 0
-    total_count = 0
+    # rglobではなくscandirで走査し、エントリごとのstatを省く
+    mkv_paths = list(find_files(directory, ".mkv"))
 
-    for mkv_path in directory.rglob("*.mkv"):
-        total_count += 1
-        if process_mkv_file(mkv_path):
-            success_count += 1
+    # ファイルごとに独立しているため並列に処理
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        results = list(executor.map(process_mkv_file, mkv_paths))
 
-    return success_count, total_count
+    return sum(results), len(mkv_paths)
 
 
 def main() -> None: